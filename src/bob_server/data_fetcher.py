@@ -1,8 +1,12 @@
 # data_fetcher.py
 
 import requests
-import json
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 import os
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv # .env 파일 로드용
 
@@ -14,36 +18,52 @@ DATA_URL = os.getenv("DATA_SOURCE_URL")
 OUTPUT_DIR = os.getenv("DATA_CACHE_DIR", "data")
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, os.getenv("DATA_CACHE_FILENAME", "meals.json"))
 
-def fetch_and_save_data():
+# 연결 재사용을 위한 공용 HTTP 세션
+_SESSION = requests.Session()
+# brotli는 설치되어 있을 때만 Accept-Encoding에 포함됩니다. (응답 압축 해제는 urllib3가 한 번에 처리)
+_SESSION.headers.update(make_headers(accept_encoding=True, keep_alive=True))
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+
+def fetch_and_save_data(indent: bool = False):
     """
     외부 URL에서 JSON 데이터를 가져와 로컬 파일에 저장합니다.
+    기본적으로 받은 바이트를 그대로 저장하며, indent=True이면 사람이 읽기 쉽게 들여쓰기하여 저장합니다.
     """
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempting to fetch data from: {DATA_URL}")
 
     try:
         # 1. 외부 JSON 데이터 가져오기
-        response = requests.get(DATA_URL, timeout=10)
+        response = _SESSION.get(DATA_URL, timeout=(3, 10), stream=False)
         response.raise_for_status() # HTTP 오류가 발생하면 예외 발생
 
-        # 2. JSON 파싱
-        remote_data = response.json()
+        # 2. JSON 검증 (유효한 JSON인지만 확인)
+        remote_data = orjson.loads(response.content)
 
         # 3. 출력 디렉토리가 없으면 생성
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-        # 4. 로컬 파일에 저장 (인코딩 및 들여쓰기 설정)
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            # 원본 데이터 구조를 그대로 저장하여 MCP 서버가 사용하도록 함
-            json.dump(remote_data, f, ensure_ascii=False, indent=2)
+        # 4. 로컬 파일에 저장 (서버가 읽는 용도이므로 기본은 원본 바이트를 그대로 기록)
+        with open(OUTPUT_FILE, 'wb') as f:
+            if indent:
+                f.write(orjson.dumps(remote_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            else:
+                f.write(response.content)
         
         print(f"Success! Data saved to {OUTPUT_FILE}")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         print("Error: Could not decode response as JSON.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
-    fetch_and_save_data()
+    parser = argparse.ArgumentParser(description="외부 식단 JSON 데이터를 로컬 파일로 저장합니다.")
+    parser.add_argument("--indent", action="store_true", help="디버깅용으로 들여쓰기된 JSON을 저장합니다.")
+    args = parser.parse_args()
+    fetch_and_save_data(indent=args.indent)
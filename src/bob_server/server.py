@@ -1,14 +1,25 @@
 import os
 # UTF-8 인코딩을 강제 설정합니다. (Windows 환경 호환성)
 os.environ['PYTHONIOENCODING'] = 'utf-8'
-import sys
-import json
-from datetime import datetime, timedelta # timedelta 추가
+import logging
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta # timedelta 추가
 from mcp.server.fastmcp import FastMCP, Context
 from smithery.decorators import smithery
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+from typing import Annotated, Optional
+import orjson  # 빠른 JSON 파싱
+try:
+    import simdjson  # 선택 의존성: 조회하는 날짜의 데이터만 파이썬 객체로 변환
+except ImportError:
+    simdjson = None
 import requests  # HTTP 요청을 위한 라이브러리
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv  # .env 파일 로드를 위해 추가
 
 # --- 설정 및 환경 변수 로드 ---
@@ -16,35 +27,184 @@ from dotenv import load_dotenv  # .env 파일 로드를 위해 추가
 #DATA_SOURCE_URL = os.environ.get("DATA_SOURCE_URL")
 DATA_SOURCE_URL="https://soonga00.github.io/ssafy-meal-data/meals.json"
 
+# 디버그 로그는 레벨이 꺼져 있으면 포맷팅/출력 비용이 들지 않습니다.
+log = logging.getLogger("bob_server")
+
+# --- HTTP 세션 ---
+# 요청마다 TCP/TLS 연결을 새로 맺지 않도록 keep-alive 세션을 프로세스 전체에서 재사용합니다.
+_SESSION = requests.Session()
+# brotli는 설치되어 있을 때만 Accept-Encoding에 포함됩니다. (응답 압축 해제는 urllib3가 한 번에 처리)
+_SESSION.headers.update(make_headers(accept_encoding=True, keep_alive=True))
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+
+# --- 캐시 설정 ---
+# 식단 데이터는 하루 단위로만 바뀌므로 TTL 동안은 네트워크 호출 없이 메모리에 보관한 값을 반환합니다.
+_TTL = float(os.getenv("DATA_TTL_SECONDS", "900"))
+# snapshot: {"data": 파싱된 데이터, "index": 날짜별로 층 단위로 묶어 둔 식단}
+#           데이터가 바뀌면 새 딕셔너리로 통째로 교체하므로, 스냅샷을 한 번 받아 쓰는 쪽은 항상 서로 맞는 data/index를 봅니다.
+# etag/last_modified: 조건부 요청(If-None-Match/If-Modified-Since)에 사용할 검증자
+_CACHE = {"snapshot": None, "ts": 0.0, "etag": None, "last_modified": None}
+_CACHE_LOCK = threading.Lock()
+
+def _cache_is_fresh() -> bool:
+    return _CACHE["snapshot"] is not None and time.monotonic() - _CACHE["ts"] < _TTL
+
+def _parse_meals(raw: bytes):
+    """응답 바이트를 파싱합니다. pysimdjson이 설치되어 있으면 지연 변환되는 문서 객체를, 없으면 딕셔너리를 반환합니다."""
+    if simdjson is not None:
+        # 파서를 재사용하면 이전 문서가 무효화되므로 캐시를 갱신할 때마다 새 파서를 만듭니다.
+        return simdjson.Parser().parse(raw)
+    return orjson.loads(raw)
+
+def _build_day_index(daily_data: list) -> dict:
+    """하루치 식단을 층별로 묶습니다. "__ALL__"에는 전체 층이, 대문자 층 이름 키에는 해당 층의 식단만 담깁니다.
+    각 값은 층 이름 순으로 정렬된, 미리 출력 형식으로 만들어 둔 층별 문자열 블록의 튜플입니다.
+    만든 뒤에는 수정하지 않으므로 여러 스레드가 락 없이 함께 읽을 수 있습니다."""
+    meals_by_floor = {}
+    for meal in daily_data:
+        meal_floor = meal.get("floor")
+        # 줄바꿈 문자를 쉼표+공백으로 변경하여 가독성 확보 (인덱스를 만들 때 한 번만, 줄바꿈이 있을 때만 처리)
+        meal_name = meal.get('name') or 'N/A'
+        if '\n' in meal_name:
+            meal_name = meal_name.replace('\n', ', ')
+        meals_by_floor.setdefault(meal_floor, []).append((meal.get('type', 'N/A'), meal_name))
+
+    day = {"__ALL__": ()}
+    # 층 정보가 없는 식단(None)은 문자열과 비교할 수 없으므로 맨 뒤로 보냅니다.
+    for meal_floor, meals in sorted(meals_by_floor.items(), key=lambda kv: (kv[0] is None, kv[0] or "")):
+        # 층 제목, 메뉴 줄, 구분선을 한 블록으로 미리 만들어 두어 조회할 때는 이어 붙이기만 합니다.
+        meal_lines = [f"  - {meal_type}: {meal_name}\n" for meal_type, meal_name in meals]
+        block = "".join([f"📍 {meal_floor}\n", *meal_lines, _SEP20_LINE])
+        day["__ALL__"] += (block,)
+        if meal_floor:
+            day[meal_floor.upper()] = day.get(meal_floor.upper(), ()) + (block,)
+    return day
+
 # --- 유틸리티 함수 (URL에서 직접 가져오도록 수정됨) ---
+def _refresh_cache(force: bool = False) -> dict:
+    """URL에서 데이터를 다시 받아 캐시를 갱신합니다. force가 아니면 락을 얻은 뒤 캐시가 이미 갱신되었는지 다시 확인합니다."""
+    with _CACHE_LOCK:
+        # 락을 기다리는 동안 다른 스레드가 이미 갱신했을 수 있으므로 다시 확인
+        if not force and _cache_is_fresh():
+            return _CACHE["snapshot"]
+
+        try:
+            # 1. URL에서 데이터 가져오기 (이전 응답의 ETag/Last-Modified가 있으면 조건부 요청)
+            headers = {}
+            if _CACHE["snapshot"] is not None:
+                if _CACHE["etag"]:
+                    headers["If-None-Match"] = _CACHE["etag"]
+                if _CACHE["last_modified"]:
+                    headers["If-Modified-Since"] = _CACHE["last_modified"]
+            response = _SESSION.get(DATA_SOURCE_URL, headers=headers, timeout=(3, 10), stream=False)
+
+            # 304: 내용이 바뀌지 않았으므로 본문 전송/파싱 없이 TTL만 연장
+            if response.status_code == 304:
+                _CACHE["etag"] = response.headers.get("ETag", _CACHE["etag"])
+                _CACHE["last_modified"] = response.headers.get("Last-Modified", _CACHE["last_modified"])
+                _CACHE["ts"] = time.monotonic()
+                log.debug("Data not modified at %s", DATA_SOURCE_URL)
+                return _CACHE["snapshot"]
+
+            # HTTP 오류 (4xx, 5xx) 발생 시 예외 처리 (성공 시에는 상태 코드 비교 한 번으로 끝남)
+            status_code = response.status_code
+            if status_code >= 400:
+                raise requests.HTTPError(f"HTTP {status_code} for url: {DATA_SOURCE_URL}", response=response)
+        
+            # 2. JSON 파싱
+            data = _parse_meals(response.content)
+            snapshot = {"data": data, "index": {}}
+            _CACHE["snapshot"] = snapshot
+            _CACHE["etag"] = response.headers.get("ETag")
+            _CACHE["last_modified"] = response.headers.get("Last-Modified")
+            _CACHE["ts"] = time.monotonic()
+            log.debug("Data successfully fetched from %s", DATA_SOURCE_URL)
+            return snapshot
+        
+        except requests.exceptions.RequestException as e:
+            log.exception("Failed to fetch data from URL")
+            return {"error": f"Failed to fetch data from URL: {e}"}
+        except ValueError:  # orjson.JSONDecodeError, simdjson 파싱 오류 모두 ValueError
+            log.exception("Failed to parse JSON response from URL.")
+            return {"error": "Failed to parse JSON response."}
+
 def fetch_data_from_url() -> dict:
-    """외부 URL에서 실시간으로 JSON 데이터를 가져와 딕셔너리로 반환합니다."""
+    """외부 URL에서 JSON 데이터를 가져와 캐시 스냅샷({"data", "index"})으로 반환합니다. (TTL 동안 캐시된 값을 재사용)"""
     
     # .env 파일에 URL이 설정되어 있는지 확인
     if not DATA_SOURCE_URL:
-        sys.stderr.write("ERROR: DATA_SOURCE_URL environment variable is not set in .env file.\n")
+        log.error("DATA_SOURCE_URL environment variable is not set in .env file.")
         return {"error": "Server configuration error: DATA_SOURCE_URL not set."}
 
-    try:
-        # 1. URL에서 데이터 가져오기
-        response = requests.get(DATA_SOURCE_URL)
-        response.raise_for_status()  # HTTP 오류 (4xx, 5xx) 발생 시 예외 처리
-        
-        # 2. JSON 파싱
-        data = response.json()
-        sys.stderr.write(f"DEBUG: Data successfully fetched from {DATA_SOURCE_URL}\n")
-        return data
-        
-    except requests.exceptions.RequestException as e:
-        sys.stderr.write(f"ERROR: Failed to fetch data from URL: {e}\n")
-        return {"error": f"Failed to fetch data from URL: {e}"}
-    except json.JSONDecodeError:
-        sys.stderr.write("ERROR: Failed to parse JSON response from URL.\n")
-        return {"error": "Failed to parse JSON response."}
+    # 캐시가 유효하면 락 없이 바로 반환
+    if _cache_is_fresh():
+        return _CACHE["snapshot"]
+
+    return _refresh_cache()
+
+# --- 백그라운드 갱신 ---
+def _refresh_loop():
+    """TTL이 끝나기 전에 캐시를 미리 갱신하여 도구 호출이 항상 캐시에서 처리되도록 합니다."""
+    while True:
+        try:
+            _refresh_cache(force=True)
+        except Exception:
+            log.exception("Background refresh failed")
+        # TTL이 아주 짧아도 업스트림을 쉬지 않고 호출하지 않도록 최소 1초는 기다립니다.
+        time.sleep(max(_TTL * 0.8, 1.0))
+
+def _start_refresher():
+    """백그라운드 갱신 스레드를 시작합니다. fork를 사용하는 환경에서는 BOB_BACKGROUND_REFRESH=0으로 끌 수 있습니다.
+    DATA_TTL_SECONDS가 0 이하이면(캐시 사용 안 함) 미리 갱신할 필요가 없으므로 시작하지 않습니다."""
+    if not DATA_SOURCE_URL or _TTL <= 0 or os.getenv("BOB_BACKGROUND_REFRESH", "1") == "0":
+        return
+    threading.Thread(target=_refresh_loop, name="bob-cache-refresher", daemon=True).start()
+
+_start_refresher()
+
+# 캐시가 만료된 경우 요청 경로에서 데이터 가져오기를 다른 작업과 겹쳐 실행하기 위한 스레드 풀
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bob-fetch")
+
+# --- 메뉴 포맷팅 ---
+_WEEKDAY_NAMES = ("월요일", "화요일", "수요일", "목요일", "금요일", "토요일", "일요일")
+_SEP40 = "=" * 40
+_SEP40_LINE = _SEP40 + "\n"
+_SEP20_LINE = "-" * 20 + "\n"
+
+def _parse_ymd(s: str) -> date:
+    """고정된 YYYY-MM-DD 형식을 strptime 없이 바로 변환합니다. 형식이 맞지 않으면 ValueError를 발생시킵니다."""
+    if len(s) != 10 or s[4] != "-" or s[7] != "-" or not (s[0:4] + s[5:7] + s[8:10]).isdigit():
+        raise ValueError(f"Invalid YYYY-MM-DD date: {s!r}")
+    return date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+
+def _normalize_floor(v):
+    """층 인자를 대문자로 정규화합니다. ("10f" -> "10F", "ALL" -> "all")"""
+    if isinstance(v, str):
+        v = v.strip().upper()
+        return "all" if v == "ALL" else v
+    return v
+
+# pydantic 검증 단계에서 한 번만 정규화하므로 조회할 때는 그대로 비교할 수 있습니다.
+FloorArg = Annotated[str, BeforeValidator(_normalize_floor)]
+
+@functools.lru_cache(maxsize=256)
+def _format_menu(date_str: str, day_of_week: str, target_floor: str, floor_blocks: tuple) -> str:
+    """식단 메뉴 문자열을 만듭니다. 인자만으로 결과가 정해지므로 같은 조회는 캐시된 결과를 그대로 반환합니다."""
+    floor_info = f"{target_floor} " if target_floor else ""
+    # 층별 블록은 인덱스를 만들 때 이미 완성되어 있으므로 머리말/구분선과 한 번에 합치기만 합니다.
+    header = f"📅 {date_str} ({day_of_week}) - 서울 캠퍼스 {floor_info}식단 메뉴 📋\n"
+    return "".join([header, _SEP40_LINE, *floor_blocks, _SEP40])
 
 # --- 세션 설정 스키마 ---
 class ConfigSchema(BaseModel):
     """SSAFY 식단 정보 서비스의 사용자 세션 설정을 정의합니다."""
+    # 알 수 없는 필드는 검사 없이 무시하고, 한 번 만든 설정은 변경하지 않습니다.
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     default_floor: Optional[str] = Field(None, description="자주 이용하는 식당 층을 설정합니다. (예: '10F', '20F')")
 
 # --- 도구 인자 모델 (제거하고 함수 시그니처로 통합) ---
@@ -63,70 +223,50 @@ def app():
     def get_meal_menu(
         ctx: Context,
         date: str = Field(..., description="메뉴를 조회할 날짜(YYYY-MM-DD 형식)입니다. 이 값은 필수입니다. 사용자의 질문에서 '오늘', '내일' 등 날짜 관련 언급이 있다면 그 날짜를, 별도 언급이 없다면 오늘 날짜를 YYYY-MM-DD 형식으로 변환하여 제공해야 합니다."),
-        floor: str = Field("all", description='조회할 층을 지정합니다 (예: \"10F\", \"20F\"). 사용자가 층을 언급하지 않은 경우, "all"이 기본값으로 사용됩니다.')
+        floor: FloorArg = Field("all", description='조회할 층을 지정합니다 (예: \"10F\", \"20F\"). 사용자가 층을 언급하지 않은 경우, "all"이 기본값으로 사용됩니다.')
     ) -> str:
         """지정된 날짜의 식단 메뉴를 가져옵니다. (도구 설명은 데코레이터로 이동)"""
         
-        data = fetch_data_from_url() # 실시간 URL 호출로 변경
-        
-        if "error" in data:
-            return data["error"]
-
-        date_str = date
+        # 캐시가 만료되었다면 데이터 가져오기를 먼저 시작하고, 네트워크를 기다리는 동안 날짜를 검증합니다.
+        future = None if _cache_is_fresh() else _EXECUTOR.submit(fetch_data_from_url)
 
-        # 이제 date_str은 LLM에 의해 항상 제공됩니다. (예: "2024-07-26")
+        # 이제 date는 LLM에 의해 항상 제공됩니다. (예: "2024-07-26")
         try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            day_of_week = ["월요일", "화요일", "수요일", "목요일", "금요일", "토요일", "일요일"][date_obj.weekday()]
+            day_of_week = _WEEKDAY_NAMES[_parse_ymd(date).weekday()]
         except ValueError:
             # LLM이 "오늘", "내일" 등을 YYYY-MM-DD로 변환하지 않고 그대로 보낸 경우
             return f"Error: LLM이 잘못된 날짜 형식으로 도구를 호출했습니다: '{date}'. YYYY-MM-DD 형식이 필요합니다."
 
-        daily_data = data.get(date_str)
-        if not daily_data:
-            return f"Error: 해당 날짜({date_str})의 식단 데이터가 없습니다."
+        # 스냅샷은 한 번만 받아 이 호출이 끝날 때까지 사용합니다. (중간에 백그라운드 갱신이 일어나도 데이터가 섞이지 않음)
+        snapshot = future.result() if future is not None else fetch_data_from_url()
         
-        # 인자로 받은 floor 값을 직접 사용
-        target_floor = floor
+        if "error" in snapshot:
+            return snapshot["error"]
 
-        meals_by_floor = {}
-        
-        # daily_data가 리스트인지 확인 (JSON 구조에 따라)
-        if not isinstance(daily_data, list):
-             sys.stderr.write(f"ERROR: Expected list for date {date_str}, but got {type(daily_data)}.\n")
-             return f"Error: 데이터 구조 오류. {date_str}의 데이터가 리스트 형태가 아닙니다."
-        
-        for meal in daily_data:
-            meal_floor = meal.get("floor")
-            
-            # target_floor가 "all"이 아니고, 현재 식단의 층과 다르면 건너뜀
-            if target_floor.lower() != 'all' and (not meal_floor or target_floor.upper() != meal_floor.upper()):
-                continue
-
-            if meal_floor not in meals_by_floor:
-                meals_by_floor[meal_floor] = []
-            
-            # 줄바꿈 문자를 쉼표+공백으로 변경하여 가독성 확보
-            meal['name'] = meal.get('name', 'N/A').replace('\n', ', ')
-            meals_by_floor[meal_floor].append(meal)
-
-        if not meals_by_floor:
-            return f"{date_str}에 {target_floor+'의 ' if target_floor else ''}메뉴 정보가 없습니다."
-
-        floor_info = f"{target_floor} " if target_floor else ""
-        formatted_output = f"📅 {date_str} ({day_of_week}) - 서울 캠퍼스 {floor_info}식단 메뉴 📋\n"
-        formatted_output += "=" * 40 + "\n"
-
-        for f, meals in sorted(meals_by_floor.items()):
-            formatted_output += f"📍 {f}\n"
-            for meal in meals:
-                meal_type = meal.get('type', 'N/A')
-                meal_name = meal.get('name', 'N/A') # 이미 위에서 \n 처리됨
-                formatted_output += f"  - {meal_type}: {meal_name}\n"
-            formatted_output += "-" * 20 + "\n"
-
-        formatted_output += "=" * 40
-        return formatted_output
+        # 날짜별 인덱스는 캐시가 갱신된 뒤 처음 조회될 때 한 번만 만듭니다.
+        day = snapshot["index"].get(date)
+        if day is None:
+            daily_data = snapshot["data"].get(date)
+            # pysimdjson 문서라면 조회한 날짜의 데이터만 파이썬 리스트로 변환
+            if simdjson is not None and isinstance(daily_data, simdjson.Array):
+                daily_data = daily_data.as_list()
+            if not daily_data:
+                return f"Error: 해당 날짜({date})의 식단 데이터가 없습니다."
+
+            # daily_data가 리스트인지 확인 (JSON 구조에 따라)
+            if not isinstance(daily_data, list):
+                 log.error("Expected list for date %s, but got %s.", date, type(daily_data))
+                 return f"Error: 데이터 구조 오류. {date}의 데이터가 리스트 형태가 아닙니다."
+
+            day = _build_day_index(daily_data)
+            snapshot["index"][date] = day
+
+        # floor가 "all"이면 전체 층, 아니면 해당 층만 (이미 대문자로 정규화됨)
+        floor_blocks = day["__ALL__"] if floor == "all" else day.get(floor, ())
+        if not floor_blocks:
+            return f"{date}에 {floor+'의 ' if floor else ''}메뉴 정보가 없습니다."
+
+        return _format_menu(date, day_of_week, floor, floor_blocks)
         
     return mcp
 